@@ -1,9 +1,15 @@
 """Snap and purchase endpoint - orchestrates image detection, search, and purchase."""
 
 from fastapi import APIRouter, File, UploadFile, HTTPException, Query
-from typing import List, Optional
+from typing import List, Optional, Union
 from pydantic import BaseModel
 import base64
+import binascii
+
+try:
+    import pybase64  # SIMD base64 codec; optional
+except ImportError:
+    pybase64 = None
 
 from app.services.segmentation_service import get_segmentation_service, DetectedProduct
 from app.services.google_search import get_search_service, SearchResult
@@ -13,6 +19,74 @@ from app.services.product_matcher import get_product_matcher, ProductMatchResult
 
 router = APIRouter(prefix="/snap-purchase")
 
+# Characters of base64 decoded per step; must stay a multiple of 4.
+_B64_CHUNK_CHARS = 64 * 1024
+
+# Uploads past this are rejected; Gemini caps inline image data at ~20 MB anyway.
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+_UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+async def _read_capped(upload: UploadFile, max_bytes: int = MAX_IMAGE_BYTES) -> bytearray:
+    """
+    Read an upload in 1 MiB chunks, failing with 413 once it exceeds max_bytes.
+
+    The buffer is pre-sized from upload.size when known and returned as-is,
+    so the image is held once rather than copied into a final bytes object.
+    """
+    if upload.size is not None and upload.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Image exceeds {max_bytes} byte limit")
+
+    buffer = bytearray(upload.size or 0)
+    pos = 0
+    while chunk := await upload.read(_UPLOAD_CHUNK_BYTES):
+        end = pos + len(chunk)
+        if end > max_bytes:
+            raise HTTPException(status_code=413, detail=f"Image exceeds {max_bytes} byte limit")
+        # Overwrites the pre-sized region; grows the buffer if size was unknown or short.
+        buffer[pos:end] = chunk
+        pos = end
+    del buffer[pos:]
+    return buffer
+
+
+def _decode_base64_streaming(
+    data: str, start: int = 0, chunk_size: int = _B64_CHUNK_CHARS
+) -> Union[bytes, bytearray]:
+    """
+    Decode data[start:] as base64 in fixed-size windows.
+
+    Avoids the full-size ASCII copy (and prefix slice) a one-shot
+    b64decode makes of a multi-MB string, and returns the decode buffer
+    itself rather than a bytes copy of it. Input that does not split cleanly
+    (stray characters, early padding) falls back to base64.b64decode, so
+    results and errors match it.
+    """
+    end = len(data)
+    out = bytearray((end - start) * 3 // 4)
+    pos = 0
+    complete = True
+    with memoryview(out) as view:
+        for offset in range(start, end, chunk_size):
+            window = data[offset:offset + chunk_size]
+            # a2b_base64 stops at padding, so only the last window may hold it.
+            if offset + chunk_size < end and '=' in window:
+                complete = False
+                break
+            try:
+                decoded = binascii.a2b_base64(window)
+            except ValueError:
+                complete = False
+                break
+            view[pos:pos + len(decoded)] = decoded
+            pos += len(decoded)
+
+    if not complete:
+        return base64.b64decode(data[start:])
+    # Trim in place; the view must be released before the buffer can shrink.
+    del out[pos:]
+    return out
+
 
 class DetectionResponse(BaseModel):
     """Response from product detection."""
@@ -69,7 +143,7 @@ async def detect_products_in_image(
     bounding boxes, labels, and fill levels.
     """
     # Read image bytes
-    image_bytes = await image.read()
+    image_bytes = await _read_capped(image)
 
     # Determine MIME type
     mime_type = image.content_type or 'image/png'
@@ -175,13 +249,19 @@ async def snap_and_buy(request: SnapAndBuyRequest):
     Accepts JSON with base64-encoded image in the request body.
     """
     # Step 1: Decode base64 image
-    try:
-        # Remove the data URL prefix if present (e.g., "data:image/png;base64,")
-        base64_data = request.image_surroundings
-        if ',' in base64_data:
-            base64_data = base64_data.split(',', 1)[1]
+    # Skip the data URL prefix if present (e.g., "data:image/png;base64,")
+    base64_data = request.image_surroundings
+    start = base64_data.find(',') + 1
+    # Reject oversized payloads from their length alone, before decoding.
+    if (len(base64_data) - start) * 3 // 4 > MAX_IMAGE_BYTES:
+        raise HTTPException(status_code=413, detail=f"Image exceeds {MAX_IMAGE_BYTES} byte limit")
 
-        image_bytes = base64.b64decode(base64_data)
+    try:
+        if pybase64 is not None:
+            # Trades the full-size prefix slice for a much faster SIMD decode.
+            image_bytes = pybase64.b64decode(base64_data[start:], validate=False)
+        else:
+            image_bytes = _decode_base64_streaming(base64_data, start)
         mime_type = 'image/jpeg'  # Default to JPEG since client uses JPG encoding
 
         # DEBUG: Save image to file for inspection
@@ -2,11 +2,26 @@
 
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
+from typing import Optional
 import os
+import traceback
 from google import genai
 
 router = APIRouter()
 
+# Gemini client shared across requests (created on first use)
+_client: Optional[genai.Client] = None
+
+
+def _get_client() -> Optional[genai.Client]:
+    """Get or create the Gemini client, or None if no API key is configured."""
+    global _client
+    if _client is None:
+        api_key = os.getenv("GEMINI_API_KEY")
+        if api_key:
+            _client = genai.Client(api_key=api_key)
+    return _client
+
 
 class SummarizeRequest(BaseModel):
     """Request body for summarization."""
@@ -25,17 +40,15 @@ async def summarize_text(request: SummarizeRequest):
 
     This endpoint accepts a prompt and uses Gemini to generate a concise summary.
     """
-    api_key = os.getenv("GEMINI_API_KEY")
+    client = _get_client()
 
-    if not api_key:
+    if client is None:
         raise HTTPException(
             status_code=500,
             detail="GEMINI_API_KEY not configured"
         )
 
     try:
-        client = genai.Client(api_key=api_key)
-
         print(f"[DEBUG] Summarize request: {request.summaryPrompt[:200]}...")
 
         response = client.models.generate_content(
@@ -54,7 +67,6 @@ async def summarize_text(request: SummarizeRequest):
 
     except Exception as e:
         print(f"[ERROR] Summarization failed: {e}")
-        import traceback
         traceback.print_exc()
         raise HTTPException(
             status_code=500,
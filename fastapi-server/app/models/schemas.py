@@ -33,6 +33,11 @@ class FillLevel(str, Enum):
     EMPTY = "EMPTY"
 
 
+# Integer rank per fill level (declaration order, FULL=0 .. EMPTY=4) so threshold
+# checks are a plain int compare instead of list(FillLevel).index() on every call.
+FILL_LEVEL_RANK: Dict[FillLevel, int] = {level: rank for rank, level in enumerate(FillLevel)}
+
+
 class ConfirmationChannel(str, Enum):
     """Supported confirmation modalities coming from Spectacles."""
 
@@ -54,6 +59,8 @@ class OrderStatus(str, Enum):
 
 
 class ProductVariant(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     sku: constr(strip_whitespace=True, min_length=2)  # type: ignore[valid-type]
     label: constr(strip_whitespace=True, min_length=2)
     size: Optional[str] = Field(default=None, description="Human readable size, e.g. 24-pack")
@@ -61,6 +68,10 @@ class ProductVariant(BaseModel):
 
 
 class Product(BaseModel):
+    """Catalog row; frozen because catalog singletons are shared across requests."""
+
+    model_config = ConfigDict(frozen=True)
+
     id: constr(strip_whitespace=True, min_length=2)  # type: ignore[valid-type]
     object_class: constr(strip_whitespace=True, min_length=2)
     default_variant: ProductVariant
@@ -80,7 +91,7 @@ class DetectionEvent(BaseModel):
 
     event_id: constr(strip_whitespace=True, min_length=8)  # type: ignore[valid-type]
     device_id: constr(strip_whitespace=True, min_length=4)
-    object_class: constr(strip_whitespace=True, min_length=2)
+    object_class: constr(strip_whitespace=True, to_lower=True, min_length=2)
     fill_level: FillLevel
     confidence: DetectionConfidence
     captured_at_ms: PositiveInt = Field(description="Client-side timestamp in epoch ms")
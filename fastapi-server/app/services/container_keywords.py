@@ -0,0 +1,22 @@
+"""Label keywords used to keep fillable containers and drop other detections."""
+
+import re
+
+CONTAINER_KEYWORDS = (
+    'bottle', 'container', 'tube', 'jar', 'vial', 'canister',
+    'dispenser', 'pump', 'spray', 'dropper', 'flask',
+    'can', 'cartridge', 'syringe',
+)
+
+NON_CONTAINER_KEYWORDS = (
+    'phone', 'book', 'paper', 'card', 'electronics', 'cable', 'charger',
+    'mug', 'cup', 'plate', 'bowl', 'utensil', 'fork', 'spoon', 'knife',
+    'clothing', 'fabric', 'textile', 'bag', 'backpack', 'shirt', 'shoe',
+    'food', 'fruit', 'vegetable', 'apple', 'banana', 'orange',
+    'soap bar', 'bar', 'solid', 'brick', 'block', 'tile', 'stone',
+)
+
+# One compiled alternation per keyword set: a single search per lowercased
+# label instead of a Python-level substring test per keyword.
+CONTAINER_RE = re.compile("|".join(map(re.escape, CONTAINER_KEYWORDS)))
+NON_CONTAINER_RE = re.compile("|".join(map(re.escape, NON_CONTAINER_KEYWORDS)))
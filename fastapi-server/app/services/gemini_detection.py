@@ -3,6 +3,7 @@
 from google import genai
 from google.genai import types
 import os
+import traceback
 from typing import List, Optional
 import json
 from pydantic import BaseModel
@@ -141,7 +142,6 @@ IF NO FILLABLE CONTAINERS ARE DETECTED: Return an empty JSON array [] in the req
 
         except Exception as e:
             print(f"[ERROR] Error detecting products with Gemini: {e}")
-            import traceback
             traceback.print_exc()
             raise
 
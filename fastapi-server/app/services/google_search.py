@@ -90,33 +90,24 @@ class GoogleSearchService:
         results = await self.search_shopify_product(product_label, max_results=10)
 
         # Prioritize results with /products/ in the URL (actual product pages)
-        # Exclude /collections/ URLs
-        product_page_results = [
-            r for r in results
-            if "/products/" in r.url and "/collections/" not in r.url
-        ]
-
-        if product_page_results:
-            # Return the first product page result
-            return product_page_results[0].url
+        # Exclude /collections/ URLs. Each tier stops at its first hit
+        # rather than building a filtered list only to take element 0.
+        url = next(
+            (r.url for r in results if "/products/" in r.url and "/collections/" not in r.url),
+            None
+        )
+        if url is not None:
+            return url
 
         # Fall back to any Shopify URL with /products/
-        shopify_product_results = [
-            r for r in results
-            if "/products/" in r.url
-        ]
-
-        if shopify_product_results:
-            return shopify_product_results[0].url
+        url = next((r.url for r in results if "/products/" in r.url), None)
+        if url is not None:
+            return url
 
         # Last resort: any result that's not a collection page
-        non_collection_results = [
-            r for r in results
-            if "/collections/" not in r.url
-        ]
-
-        if non_collection_results:
-            return non_collection_results[0].url
+        url = next((r.url for r in results if "/collections/" not in r.url), None)
+        if url is not None:
+            return url
 
         # If all else fails, return the first result
         if results:
@@ -9,10 +9,12 @@ from __future__ import annotations
 import asyncio
 import time
 import uuid
+from collections import OrderedDict
 from dataclasses import dataclass
 from typing import Dict, Optional, Tuple
 
 from app.models.schemas import (
+    FILL_LEVEL_RANK,
     ConfirmationChannel,
     DetectionEvent,
     DetectionIngestResponse,
@@ -26,8 +28,11 @@ from app.models.schemas import (
     PromptIntent,
 )
 
+# Orders in these states will not change again, so they expire sooner.
+_TERMINAL_ORDER_STATUSES = frozenset({OrderStatus.CONFIRMED, OrderStatus.FAILED})
 
-@dataclass
+
+@dataclass(slots=True)
 class IntentState:
     intent: PromptIntent
     product: Product
@@ -47,11 +52,20 @@ class PromptIntentStore:
         self,
         prompt_cooldown_ms: int = 5 * 60 * 1000,
         intent_ttl_ms: int = 15 * 60 * 1000,
+        max_orders: int = 10_000,
+        order_ttl_ms: int = 24 * 60 * 60 * 1000,
+        terminal_order_ttl_ms: int = 60 * 60 * 1000,
     ) -> None:
         self._prompt_cooldown_ms = prompt_cooldown_ms
         self._intent_ttl_ms = intent_ttl_ms
+        self._max_orders = max_orders
+        self._order_ttl_ms = order_ttl_ms
+        self._terminal_order_ttl_ms = terminal_order_ttl_ms
         self._state: Dict[str, IntentState] = {}
-        self._orders: Dict[str, OrderRecord] = {}
+        # intent_id -> state key, so intent lookups skip the scan over _state.
+        self._intent_keys: Dict[str, str] = {}
+        # LRU-ordered so order history stays bounded in a long-running process.
+        self._orders: OrderedDict[str, OrderRecord] = OrderedDict()
         self._lock = asyncio.Lock()
 
     # ------------------------ Detection ingestion ---------------------------------
@@ -62,8 +76,8 @@ class PromptIntentStore:
         product: Product,
         variant: ProductVariant,
     ) -> DetectionIngestResponse:
+        key = self._device_object_key(detection)
         async with self._lock:
-            key = self._device_object_key(detection)
             now_ms = self._now_ms()
             stale_keys = [
                 k
@@ -71,7 +85,8 @@ class PromptIntentStore:
                 if state.intent.expires_at_ms < now_ms
             ]
             for stale in stale_keys:
-                self._state.pop(stale, None)
+                stale_state = self._state.pop(stale)
+                self._intent_keys.pop(stale_state.intent.intent_id, None)
 
             existing_state = self._state.get(key)
             if existing_state:
@@ -108,7 +123,10 @@ class PromptIntentStore:
                 variant=variant,
                 last_prompted_at_ms=now_ms,
             )
+            if existing_state:
+                self._intent_keys.pop(existing_state.intent.intent_id, None)
             self._state[key] = state
+            self._intent_keys[intent_id] = key
             return DetectionIngestResponse(
                 should_prompt=True,
                 reason=None,
@@ -120,12 +138,13 @@ class PromptIntentStore:
 
     async def get_intent(self, intent_id: str) -> Optional[IntentState]:
         async with self._lock:
-            for state in self._state.values():
-                if state.intent.intent_id == intent_id:
-                    if state.intent.expires_at_ms < self._now_ms():
-                        return None
-                    return state
-            return None
+            entry = self._find_state_by_intent(intent_id)
+            if not entry:
+                return None
+            _, state = entry
+            if state.intent.expires_at_ms < self._now_ms():
+                return None
+            return state
 
     # ----------------------- Prompt decision handling -----------------------------
 
@@ -140,12 +159,11 @@ class PromptIntentStore:
                     message="Intent expired or unknown.",
                 )
 
-            state_key, state = state_entry
+            _, state = state_entry
             state.accepted = request.accepted
             state.decision_channel = request.channel
 
             if not request.accepted:
-                self._state[state_key] = state
                 return PromptDecisionResponse(
                     status=OrderStatus.FAILED,
                     message="User declined reorder.",
@@ -154,7 +172,6 @@ class PromptIntentStore:
             order_id = uuid.uuid4().hex[:12]
             state.order_id = order_id
             state.order_status = OrderStatus.PENDING
-            self._state[state_key] = state
             return PromptDecisionResponse(
                 order_id=order_id,
                 status=OrderStatus.PENDING,
@@ -171,31 +188,56 @@ class PromptIntentStore:
         async with self._lock:
             entry = self._find_state_by_intent(intent_id)
             if entry:
-                state_key, state = entry
+                _, state = entry
                 state.order_id = order.order_id
                 state.order_status = order.status
                 state.order_error = order.error
                 self._orders[order.order_id] = order
-                self._state[state_key] = state
+                self._orders.move_to_end(order.order_id)
+                self._evict_orders()
 
     async def get_order(self, order_id: str) -> Optional[OrderRecord]:
         async with self._lock:
-            return self._orders.get(order_id)
+            order = self._orders.get(order_id)
+            if order is None:
+                return None
+            if self._order_expired(order, self._now_ms()):
+                del self._orders[order_id]
+                return None
+            self._orders.move_to_end(order_id)
+            return order
 
     # ----------------------------- Internals --------------------------------------
 
-    def _device_object_key(self, detection: DetectionEvent) -> str:
-        return f"{detection.device_id}:{detection.object_class.lower()}"
+    @staticmethod
+    def _device_object_key(detection: DetectionEvent) -> str:
+        # object_class is already lowercased by the DetectionEvent schema.
+        return f"{detection.device_id}:{detection.object_class}"
 
     def _should_prompt(self, product: Product, fill_level: FillLevel) -> bool:
-        levels = list(FillLevel)
-        return levels.index(fill_level) >= levels.index(product.reorder_threshold)
+        return FILL_LEVEL_RANK[fill_level] >= FILL_LEVEL_RANK[product.reorder_threshold]
+
+    def _evict_orders(self) -> None:
+        """Drop least recently used orders past the size cap or TTL."""
+        now_ms = self._now_ms()
+        while self._orders:
+            oldest = next(iter(self._orders.values()))
+            if len(self._orders) <= self._max_orders and not self._order_expired(oldest, now_ms):
+                break
+            self._orders.popitem(last=False)
+
+    def _order_expired(self, order: OrderRecord, now_ms: int) -> bool:
+        if order.status in _TERMINAL_ORDER_STATUSES:
+            ttl_ms = self._terminal_order_ttl_ms
+        else:
+            ttl_ms = self._order_ttl_ms
+        return order.updated_at_ms < now_ms - ttl_ms
 
     def _find_state_by_intent(self, intent_id: str) -> Optional[Tuple[str, IntentState]]:
-        for key, state in self._state.items():
-            if state.intent.intent_id == intent_id:
-                return key, state
-        return None
+        key = self._intent_keys.get(intent_id)
+        if key is None:
+            return None
+        return key, self._state[key]
 
     @staticmethod
     def _now_ms() -> int:
@@ -10,10 +10,10 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import Dict, Iterable, Optional
 
-from app.models.schemas import FillLevel, Product, ProductVariant
+from app.models.schemas import FILL_LEVEL_RANK, FillLevel, Product, ProductVariant
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class CatalogEntry:
     product: Product
     variants_by_sku: Dict[str, ProductVariant]
@@ -59,8 +59,7 @@ class ProductCatalogService:
             return False
 
         threshold = entry.product.reorder_threshold
-        levels = list(FillLevel)
-        return levels.index(fill_level) >= levels.index(threshold)
+        return FILL_LEVEL_RANK[fill_level] >= FILL_LEVEL_RANK[threshold]
 
 
 # ----------------------------------------------------------------------------
@@ -1,14 +1,23 @@
 """Product matching service for catalog-based product discovery."""
 
-import json
+import atexit
 import os
-from typing import List, Optional, Dict, Any
-from pydantic import BaseModel
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional, Dict, Any, Tuple
+
+import orjson
+from pydantic import BaseModel, ConfigDict
 from pathlib import Path
 
 
 class CatalogProduct(BaseModel):
     """Represents a product in our catalog."""
+    # Frozen: instances are shared through the match cache and replaced
+    # wholesale on update, never mutated in place.
+    model_config = ConfigDict(frozen=True)
+
     id: str
     name: str
     category: str  # e.g., "water bottle", "shampoo", "toothpaste"
@@ -26,10 +35,46 @@ class ProductMatchResult(BaseModel):
     match_reason: str
 
 
+@dataclass(frozen=True)
+class _MatchFields:
+    """Lowercased product fields, precomputed once per catalog change."""
+    category: str
+    keywords: Tuple[Tuple[str, str], ...]  # (original, lowercased)
+    attributes: Tuple[Tuple[str, str, str], ...]  # (key, original, lowercased)
+    name_words: frozenset
+
+    @classmethod
+    def from_product(cls, product: CatalogProduct) -> "_MatchFields":
+        return cls(
+            category=product.category.lower(),
+            keywords=tuple((k, k.lower()) for k in product.keywords),
+            attributes=tuple(
+                (key, value, value.lower())
+                for key, value in product.attributes.items()
+                if isinstance(value, str)
+            ),
+            name_words=frozenset(product.name.lower().split()),
+        )
+
+
+@dataclass(frozen=True, eq=False)
+class _CatalogSnapshot:
+    """Immutable catalog view, replaced wholesale (copy-on-write) on every mutation."""
+    products: Dict[str, CatalogProduct]
+    match_index: Tuple[Tuple[CatalogProduct, _MatchFields], ...]
+
+    @classmethod
+    def build(cls, products: Dict[str, CatalogProduct]) -> "_CatalogSnapshot":
+        return cls(
+            products=products,
+            match_index=tuple((p, _MatchFields.from_product(p)) for p in products.values()),
+        )
+
+
 class ProductMatcher:
     """Service for matching detected products to catalog."""
 
-    def __init__(self, catalog_path: Optional[str] = None):
+    def __init__(self, catalog_path: Optional[str] = None, flush_delay_seconds: float = 1.0):
         if catalog_path is None:
             # Default catalog path
             catalog_path = os.path.join(
@@ -39,7 +84,22 @@ class ProductMatcher:
             )
 
         self.catalog_path = catalog_path
-        self.catalog: List[CatalogProduct] = []
+        # Readers grab the current snapshot without locking; writers copy it,
+        # edit the copy and swap it in under _write_lock.
+        self._snapshot = _CatalogSnapshot.build({})
+        self._write_lock = threading.Lock()
+        # Detections arrive frame after frame with the same label, so memoize
+        # the scoring pass per instance (keyed by snapshot, cleared on change).
+        self._match_cached = lru_cache(maxsize=1024)(self._match_impl)
+
+        # Write-back persistence: mutations only mark the catalog dirty and a
+        # single delayed flush rewrites the JSON file, so bulk edits cost one write.
+        self._flush_delay_seconds = flush_delay_seconds
+        self._dirty = False
+        self._flush_timer: Optional[threading.Timer] = None
+        self._flush_lock = threading.Lock()
+        atexit.register(self.flush, reschedule=False)
+
         self._load_catalog()
 
     def _load_catalog(self):
@@ -53,62 +113,116 @@ class ProductMatcher:
             return
 
         try:
-            with open(catalog_file, 'r') as f:
-                data = json.load(f)
-                self.catalog = [CatalogProduct(**item) for item in data]
+            data = orjson.loads(catalog_file.read_bytes())
+            products = [CatalogProduct(**item) for item in data]
+            self._publish({p.id: p for p in products})
         except Exception as e:
             print(f"Error loading catalog: {e}")
-            self.catalog = []
+            self._publish({})
+
+    @property
+    def catalog(self) -> Dict[str, CatalogProduct]:
+        """Current catalog keyed by product ID (treat as read-only)."""
+        return self._snapshot.products
+
+    def _publish(self, products: Dict[str, CatalogProduct]):
+        """Swap in a new catalog snapshot and drop memoized matches."""
+        self._snapshot = _CatalogSnapshot.build(products)
+        self._match_cached.cache_clear()
 
     def _save_catalog(self, products: List[CatalogProduct]):
         """Save catalog to JSON file."""
         catalog_file = Path(self.catalog_path)
         catalog_file.parent.mkdir(parents=True, exist_ok=True)
 
-        with open(catalog_file, 'w') as f:
-            data = [p.dict() for p in products]
-            json.dump(data, f, indent=2)
+        data = [p.model_dump() for p in products]
+        catalog_file.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+
+    def _mark_dirty(self):
+        """Schedule a delayed flush of the catalog to disk."""
+        with self._flush_lock:
+            self._dirty = True
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        """Start the flush timer unless one is pending. Caller holds _flush_lock."""
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self._flush_delay_seconds, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush(self, reschedule: bool = True):
+        """
+        Write pending catalog changes to disk, if any.
+
+        Args:
+            reschedule: Retry later via the flush timer if the write fails.
+                False at interpreter exit, where no new thread can start.
+        """
+        with self._flush_lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self._dirty:
+                return
+            try:
+                self._save_catalog(list(self.catalog.values()))
+            except Exception as e:
+                if not reschedule:
+                    print(f"Error saving catalog, unsaved changes lost: {e}")
+                    return
+                # Stay dirty and retry later so the change is not silently lost.
+                print(f"Error saving catalog: {e}")
+                self._schedule_flush()
+                return
+            self._dirty = False
 
     def add_product(self, product: CatalogProduct) -> bool:
         """Add a product to the catalog."""
-        # Check if product with same ID exists
-        existing_ids = [p.id for p in self.catalog]
-        if product.id in existing_ids:
-            return False
+        with self._write_lock:
+            if product.id in self.catalog:
+                return False
 
-        self.catalog.append(product)
-        self._save_catalog(self.catalog)
+            products = dict(self.catalog)
+            products[product.id] = product
+            self._publish(products)
+
+        self._mark_dirty()
         return True
 
     def update_product(self, product_id: str, product: CatalogProduct) -> bool:
         """Update an existing product in the catalog."""
-        for i, p in enumerate(self.catalog):
-            if p.id == product_id:
-                self.catalog[i] = product
-                self._save_catalog(self.catalog)
-                return True
-        return False
+        with self._write_lock:
+            if product_id not in self.catalog:
+                return False
+
+            products = dict(self.catalog)
+            products[product_id] = product
+            self._publish(products)
+
+        self._mark_dirty()
+        return True
 
     def delete_product(self, product_id: str) -> bool:
         """Delete a product from the catalog."""
-        original_len = len(self.catalog)
-        self.catalog = [p for p in self.catalog if p.id != product_id]
+        with self._write_lock:
+            if product_id not in self.catalog:
+                return False
 
-        if len(self.catalog) < original_len:
-            self._save_catalog(self.catalog)
-            return True
-        return False
+            products = dict(self.catalog)
+            del products[product_id]
+            self._publish(products)
+
+        self._mark_dirty()
+        return True
 
     def get_all_products(self) -> List[CatalogProduct]:
         """Get all products in the catalog."""
-        return self.catalog
+        return list(self.catalog.values())
 
     def get_product(self, product_id: str) -> Optional[CatalogProduct]:
         """Get a specific product by ID."""
-        for p in self.catalog:
-            if p.id == product_id:
-                return p
-        return None
+        return self.catalog.get(product_id)
 
     def match_product(self, detected_label: str) -> ProductMatchResult:
         """
@@ -120,35 +234,42 @@ class ProductMatcher:
         Returns:
             ProductMatchResult with best match
         """
-        if not self.catalog:
-            return ProductMatchResult(
-                detected_label=detected_label,
-                matched_product=None,
-                confidence=0.0,
-                match_reason="Catalog is empty"
-            )
+        matched_product, confidence, match_reason = self._match_cached(
+            self._snapshot, detected_label.lower()
+        )
+        return ProductMatchResult(
+            detected_label=detected_label,
+            matched_product=matched_product,
+            confidence=confidence,
+            match_reason=match_reason
+        )
+
+    def _match_impl(
+        self, snapshot: _CatalogSnapshot, label_lower: str
+    ) -> Tuple[Optional[CatalogProduct], float, str]:
+        """Score a lowercased label against every product in a catalog snapshot."""
+        if not snapshot.products:
+            return None, 0.0, "Catalog is empty"
 
-        # Normalize detected label
-        label_lower = detected_label.lower()
         label_words = set(label_lower.split(", "))
 
         best_match = None
         best_score = 0.0
         best_reason = "No match found"
 
-        for product in self.catalog:
+        for product, fields in snapshot.match_index:
             score = 0.0
             matches = []
 
             # Check category match (high weight)
-            if product.category.lower() in label_lower:
+            if fields.category in label_lower:
                 score += 0.4
                 matches.append(f"category '{product.category}'")
 
             # Check keyword matches
             keyword_matches = 0
-            for keyword in product.keywords:
-                if keyword.lower() in label_lower:
+            for keyword, keyword_lower in fields.keywords:
+                if keyword_lower in label_lower:
                     keyword_matches += 1
                     matches.append(f"keyword '{keyword}'")
 
@@ -157,15 +278,13 @@ class ProductMatcher:
                 score += min(0.4, keyword_matches * 0.1)
 
             # Check attribute matches (e.g., color, material)
-            for attr_key, attr_value in product.attributes.items():
-                if isinstance(attr_value, str):
-                    if attr_value.lower() in label_lower:
-                        score += 0.05
-                        matches.append(f"attribute {attr_key}='{attr_value}'")
+            for attr_key, attr_value, attr_value_lower in fields.attributes:
+                if attr_value_lower in label_lower:
+                    score += 0.05
+                    matches.append(f"attribute {attr_key}='{attr_value}'")
 
             # Check if product name words are in detected label
-            name_words = set(product.name.lower().split())
-            common_words = label_words.intersection(name_words)
+            common_words = label_words.intersection(fields.name_words)
             if common_words:
                 score += min(0.2, len(common_words) * 0.05)
                 matches.append(f"name words: {', '.join(common_words)}")
@@ -181,19 +300,9 @@ class ProductMatcher:
 
         if confidence < 0.3:
             # Too low confidence, return no match
-            return ProductMatchResult(
-                detected_label=detected_label,
-                matched_product=None,
-                confidence=confidence,
-                match_reason=f"Low confidence match ({confidence:.2f})"
-            )
+            return None, confidence, f"Low confidence match ({confidence:.2f})"
 
-        return ProductMatchResult(
-            detected_label=detected_label,
-            matched_product=best_match,
-            confidence=confidence,
-            match_reason=best_reason
-        )
+        return best_match, confidence, best_reason
 
 
 # Singleton instance
@@ -1,10 +1,17 @@
 """Product segmentation and fill level analysis using Gemini Vision."""
 
-import copy
-import json
+import hashlib
+import io
 import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from typing import List, Dict, Any, Optional
-from PIL import Image, ImageDraw, ImageOps
+
+import orjson
+from PIL import Image, ImageDraw, ImageFont, ImageOps
 import google.generativeai as genai
 from google.generativeai.types import GenerationConfig
 from dotenv import load_dotenv
@@ -12,7 +19,54 @@ from dotenv import load_dotenv
 load_dotenv()
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
-MAX_SIDE = 1024
+# Coarse box_2d detection doesn't need more pixels than this, and every
+# extra pixel is vision tokens (latency and cost) on the Gemini side.
+MAX_SIDE = 768
+
+# Images are uploaded as JPEG at this quality rather than letting the SDK
+# serialize the PIL image itself.
+JPEG_QUALITY = 85
+
+# EXIF Orientation tag; 1 means the pixels are already upright.
+EXIF_ORIENTATION = 0x0112
+
+# Detection results memoized per segmenter, keyed by image content hash.
+DETECTION_CACHE_SIZE = 128
+
+# Kept in sync with app/services/container_keywords.py by hand: this script
+# runs standalone, without importing the app package.
+CONTAINER_KEYWORDS = (
+    'bottle', 'container', 'tube', 'jar', 'vial', 'canister',
+    'dispenser', 'pump', 'spray', 'dropper', 'flask',
+    'can', 'cartridge', 'syringe',
+)
+
+NON_CONTAINER_KEYWORDS = (
+    'phone', 'book', 'paper', 'card', 'electronics', 'cable', 'charger',
+    'mug', 'cup', 'plate', 'bowl', 'utensil', 'fork', 'spoon', 'knife',
+    'clothing', 'fabric', 'textile', 'bag', 'backpack', 'shirt', 'shoe',
+    'food', 'fruit', 'vegetable', 'apple', 'banana', 'orange',
+    'soap bar', 'bar', 'solid', 'brick', 'block', 'tile', 'stone',
+)
+
+# One compiled alternation per keyword set: a single search per lowercased
+# label instead of a Python-level substring test per keyword.
+CONTAINER_RE = re.compile("|".join(map(re.escape, CONTAINER_KEYWORDS)))
+NON_CONTAINER_RE = re.compile("|".join(map(re.escape, NON_CONTAINER_KEYWORDS)))
+
+# Array delimiters, scanned to find where the top-level JSON array closes.
+_BRACKET_RE = re.compile(r"[\[\]]")
+
+# Characters that are unsafe or awkward in overlay filenames; labels are
+# free-form model output, so '/' etc. must not reach the path.
+_FILENAME_TRANSLATION = str.maketrans({c: "_" for c in " /\\:()[]?*<>|\"'"})
+
+# Shared overlay label font, loaded once instead of per draw call. None lets
+# ImageDraw fall back to its own default.
+try:
+    _DEFAULT_FONT = ImageFont.load_default()
+except OSError:
+    _DEFAULT_FONT = None
 
 
 DETECTION_PROMPT = """
@@ -93,21 +147,14 @@ class JSONParser:
         Returns:
             Extracted JSON string
         """
-        lines = json_output.splitlines()
-        json_start = -1
-        json_end = -1
-        
-        for i, line in enumerate(lines):
-            if line.strip() == "```json":
-                json_start = i + 1
-            elif line.strip() == "```" and json_start != -1:
-                json_end = i
-                break
-        
-        if json_start != -1 and json_end != -1:
-            json_content = "\n".join(lines[json_start:json_end])
-            print(f"Extracted JSON from markdown blocks: {len(json_content)} characters")
-            return json_content.strip()
+        fence_start = json_output.find("```json")
+        if fence_start != -1:
+            json_start = fence_start + len("```json")
+            json_end = json_output.find("```", json_start)
+            if json_end != -1:
+                json_content = json_output[json_start:json_end]
+                print(f"Extracted JSON from markdown blocks: {len(json_content)} characters")
+                return json_content.strip()
         
         print("No markdown blocks found, searching for JSON directly")
         
@@ -117,13 +164,15 @@ class JSONParser:
             bracket_count = 0
             end_idx = start_idx
             
-            for i in range(start_idx, len(json_output)):
-                if json_output[i] == '[':
+            # Jump between bracket characters instead of stepping through
+            # every character in Python.
+            for match in _BRACKET_RE.finditer(json_output, start_idx):
+                if match.group() == '[':
                     bracket_count += 1
-                elif json_output[i] == ']':
+                else:
                     bracket_count -= 1
                     if bracket_count == 0:
-                        end_idx = i
+                        end_idx = match.start()
                         break
             
             if bracket_count == 0:
@@ -185,8 +234,9 @@ def _apply_conservative_estimate(item: Dict[str, Any]) -> Dict[str, Any]:
     Returns:
         Item with potentially adjusted percent_full
     """
-    item = copy.deepcopy(item)
-    label = item.get('label', '').lower()
+    # Shallow copy: only top-level scalar keys are reassigned here.
+    item = {**item}
+    label = item['_label_lower']
     original_percent = item.get('percent_full', 0)
     
     # Force lower estimates based on container type
@@ -235,24 +285,10 @@ def _is_valid_container(item: Dict[str, Any]) -> bool:
     Returns:
         True if item appears to be a valid fillable container
     """
-    label = item.get('label', '').lower()
-    
-    container_keywords = [
-        'bottle', 'container', 'tube', 'jar', 'vial', 'canister',
-        'dispenser', 'pump', 'spray', 'dropper', 'bottle', 'flask',
-        'can', 'cartridge', 'syringe', 'tube', 'bottle', 'container'
-    ]
+    label = item['_label_lower']
     
-    non_container_keywords = [
-        'phone', 'book', 'paper', 'card', 'electronics', 'cable', 'charger',
-        'mug', 'cup', 'plate', 'bowl', 'utensil', 'fork', 'spoon', 'knife',
-        'clothing', 'fabric', 'textile', 'bag', 'backpack', 'shirt', 'shoe',
-        'food', 'fruit', 'vegetable', 'apple', 'banana', 'orange',
-        'soap bar', 'bar', 'solid', 'brick', 'block', 'tile', 'stone'
-    ]
-    
-    has_container_keyword = any(keyword in label for keyword in container_keywords)
-    has_non_container_keyword = any(keyword in label for keyword in non_container_keywords)
+    has_container_keyword = CONTAINER_RE.search(label) is not None
+    has_non_container_keyword = NON_CONTAINER_RE.search(label) is not None
     
     if has_non_container_keyword and not has_container_keyword:
         print(f"  Filtered out non-container: {item['label']}")
@@ -265,6 +301,49 @@ def _is_valid_container(item: Dict[str, Any]) -> bool:
     return True
 
 
+def _to_jpeg_part(image: Image.Image, quality: int = JPEG_QUALITY) -> Dict[str, Any]:
+    """
+    Encode an image as an inline JPEG content part for generate_content.
+    
+    Args:
+        image: PIL Image to upload
+        quality: JPEG quality
+        
+    Returns:
+        Blob dict with mime_type and data
+    """
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", quality=quality)
+    return {"mime_type": "image/jpeg", "data": buf.getvalue()}
+
+
+def _postprocess_items(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Filter non-containers and apply conservative estimates to parsed items.
+    
+    Args:
+        items: Items decoded from the Gemini response
+        
+    Returns:
+        Filtered and adjusted items
+    """
+    # Lowercase each label once; both passes below key off it.
+    for item in items:
+        item['_label_lower'] = item.get('label', '').lower()
+    
+    filtered_items = [item for item in items if _is_valid_container(item)]
+    if len(filtered_items) < len(items):
+        print(f"Filtered {len(items) - len(filtered_items)} non-container objects")
+    
+    adjusted_items = [_apply_conservative_estimate(item) for item in filtered_items]
+    for item in adjusted_items:
+        del item['_label_lower']
+    
+    return adjusted_items
+
+
 class ProductSegmenter:
     """Segments and analyzes products in images."""
     
@@ -272,16 +351,22 @@ class ProductSegmenter:
         """Initialize the segmenter with model."""
         self.model = genai.GenerativeModel(model_name)
         self.parser = JSONParser()
+        self._detection_cache: "OrderedDict[bytes, List[Dict[str, Any]]]" = OrderedDict()
+        self._detection_cache_lock = threading.Lock()
     
     def load_and_preprocess_image(self, image_path: str) -> Image.Image:
         """Load and preprocess image for API processing."""
         im = Image.open(image_path)
-        im = ImageOps.exif_transpose(im)
+        # JPEG only: let libjpeg decode at a reduced scale (still >= MAX_SIDE)
+        # instead of decoding full resolution and shrinking afterwards.
+        im.draft("RGB", (MAX_SIDE, MAX_SIDE))
+        if im.getexif().get(EXIF_ORIENTATION, 1) != 1:
+            im = ImageOps.exif_transpose(im)
         
         if im.mode != "RGB":
             im = im.convert("RGB")
         
-        im.thumbnail((MAX_SIDE, MAX_SIDE), Image.Resampling.LANCZOS)
+        im.thumbnail((MAX_SIDE, MAX_SIDE), Image.Resampling.BILINEAR)
         print(f"Image resized to: {im.size}")
         
         return im
@@ -296,8 +381,36 @@ class ProductSegmenter:
         Returns:
             List of detected products with their properties
         """
+        # Re-submitted frames skip the multi-second Gemini round-trip.
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{image.mode}{image.size}".encode())
+        digest.update(image.tobytes())
+        key = digest.digest()
+        
+        with self._detection_cache_lock:
+            cached = self._detection_cache.get(key)
+            if cached is not None:
+                self._detection_cache.move_to_end(key)
+        if cached is not None:
+            print(f"Detection cache hit: {len(cached)} items")
+            return [dict(item) for item in cached]
+        
+        items = self._detect_products_uncached(image)
+        
+        # Empty results are not cached: they also signal parse failures.
+        if items:
+            with self._detection_cache_lock:
+                self._detection_cache[key] = [dict(item) for item in items]
+                self._detection_cache.move_to_end(key)
+                while len(self._detection_cache) > DETECTION_CACHE_SIZE:
+                    self._detection_cache.popitem(last=False)
+        
+        return items
+    
+    def _detect_products_uncached(self, image: Image.Image) -> List[Dict[str, Any]]:
+        """Run the Gemini detection request and post-process its response."""
         response = self.model.generate_content(
-            [DETECTION_PROMPT, image],
+            [DETECTION_PROMPT, _to_jpeg_part(image)],
             generation_config=GenerationConfig(
                 temperature=0.0,
                 top_p=0.0,
@@ -326,18 +439,12 @@ class ProductSegmenter:
             
 
             
-            items = json.loads(parsed_json)
+            items = orjson.loads(parsed_json)
             print(f"Successfully parsed {len(items)} items")
             
-            filtered_items = [item for item in items if _is_valid_container(item)]
-            if len(filtered_items) < len(items):
-                print(f"Filtered {len(items) - len(filtered_items)} non-container objects")
-            
-            adjusted_items = [_apply_conservative_estimate(item) for item in filtered_items]
+            return _postprocess_items(items)
             
-            return adjusted_items
-            
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             print(f"JSON parsing error: {e}")
             print(f"Raw response length: {len(response.text)}")
             print(f"Raw response first 500 chars: {response.text[:500]}")
@@ -346,16 +453,10 @@ class ProductSegmenter:
                 last_brace = parsed_json.rfind('}')
                 if last_brace != -1:
                     partial_json = parsed_json[:last_brace + 1] + ']'
-                    items = json.loads(partial_json)
+                    items = orjson.loads(partial_json)
                     print(f"Successfully parsed partial JSON with {len(items)} items")
                     
-                    filtered_items = [item for item in items if _is_valid_container(item)]
-                    if len(filtered_items) < len(items):
-                        print(f"Filtered {len(items) - len(filtered_items)} non-container objects")
-                    
-                    adjusted_items = [_apply_conservative_estimate(item) for item in filtered_items]
-                    
-                    return adjusted_items
+                    return _postprocess_items(items)
                 else:
                     print("No complete objects found")
                     return []
@@ -372,7 +473,8 @@ class ProductSegmenter:
         self,
         image: Image.Image,
         items: List[Dict[str, Any]],
-        output_dir: str
+        output_dir: str,
+        save_executor: Optional[ThreadPoolExecutor] = None
     ) -> None:
         """
         Create annotated overlay images for detected products.
@@ -381,50 +483,72 @@ class ProductSegmenter:
             image: Original PIL Image
             items: List of detected products
             output_dir: Directory to save output images
+            save_executor: Optional shared pool for PNG saves (a private one is used if omitted)
         """
         os.makedirs(output_dir, exist_ok=True)
         
-        for i, item in enumerate(items):
-            print(f"\nProcessing item {i+1}: {item['label']}")
-            
-            box = _normalize_box_2d(item["box_2d"])
-            y0 = int(box[0] / 1000 * image.size[1])
-            x0 = int(box[1] / 1000 * image.size[0])
-            y1 = int(box[2] / 1000 * image.size[1])
-            x1 = int(box[3] / 1000 * image.size[0])
-            
-            if y0 >= y1 or x0 >= x1:
-                print(f"  Skipping invalid box: {box}")
-                continue
-            
-            print(f"  Box coordinates: ({x0}, {y0}) to ({x1}, {y1})")
-            print(f"  Percent full: {item['percent_full']}%")
-            print(f"  Is low: {item['is_low']}")
-            print(f"  Confidence: {item['confidence']}")
-            
-            overlay = Image.new('RGBA', image.size, (0, 0, 0, 0))
-            overlay_draw = ImageDraw.Draw(overlay)
-            
-            overlay_draw.rectangle([x0, y0, x1, y1], outline=(255, 0, 0, 255), width=3)
-            
-            try:
+        # Boxes are ints in 0-1000, so pixel coords are exact integer math
+        # against the image size looked up once, not per coordinate.
+        width, height = image.size
+        boxes = [_normalize_box_2d(item["box_2d"]) for item in items]
+        
+        # Annotations are fully opaque, so drawing straight onto a copy of
+        # the RGBA base matches compositing a transparent overlay, without
+        # a full-canvas layer and alpha blend per item.
+        base = image.convert('RGBA')
+        
+        # PNG encoding releases the GIL, so saves run on a small pool while
+        # the next overlay is drawn; result() re-raises any save error.
+        saves = []
+        if save_executor is not None:
+            pool = nullcontext(save_executor)
+        else:
+            pool = ThreadPoolExecutor(max_workers=min(8, max(1, len(items))))
+        with pool as executor:
+            for i, (item, box) in enumerate(zip(items, boxes)):
+                print(f"\nProcessing item {i+1}: {item['label']}")
+                
+                y0 = box[0] * height // 1000
+                x0 = box[1] * width // 1000
+                y1 = box[2] * height // 1000
+                x1 = box[3] * width // 1000
+                
+                if y0 >= y1 or x0 >= x1:
+                    print(f"  Skipping invalid box: {box}")
+                    continue
+                
+                print(f"  Box coordinates: ({x0}, {y0}) to ({x1}, {y1})")
+                print(f"  Percent full: {item['percent_full']}%")
+                print(f"  Is low: {item['is_low']}")
+                print(f"  Confidence: {item['confidence']}")
+                
+                composite = base.copy()
+                overlay_draw = ImageDraw.Draw(composite)
+                
+                overlay_draw.rectangle([x0, y0, x1, y1], outline=(255, 0, 0, 255), width=3)
+                
                 overlay_draw.text(
                     (x0, y0 - 20),
                     f"{item['label']} ({item['percent_full']}%)",
-                    fill=(255, 0, 0, 255)
+                    fill=(255, 0, 0, 255),
+                    font=_DEFAULT_FONT
                 )
-            except:
-                pass
-            
-            overlay_filename = f"{item['label'].replace(' ', '_')}_{i}_overlay.png"
-            composite = Image.alpha_composite(image.convert('RGBA'), overlay)
-            composite.save(os.path.join(output_dir, overlay_filename))
-            print(f"  Saved overlay: {overlay_filename}")
+                
+                safe_label = item['label'].translate(_FILENAME_TRANSLATION)[:64]
+                overlay_filename = f"{safe_label}_{i}_overlay.png"
+                saves.append(executor.submit(composite.save, os.path.join(output_dir, overlay_filename)))
+                print(f"  Queued overlay: {overlay_filename}")
+        
+        for save in saves:
+            save.result()
+        print(f"Saved {len(saves)} overlays to {output_dir}")
 
 
 def extract_segmentation_masks(
     image_path: str,
-    output_dir: str = "segmentation_outputs"
+    output_dir: str = "segmentation_outputs",
+    segmenter: Optional[ProductSegmenter] = None,
+    save_executor: Optional[ThreadPoolExecutor] = None
 ) -> None:
     """
     Extract and analyze products from an image.
@@ -432,26 +556,52 @@ def extract_segmentation_masks(
     Args:
         image_path: Path to input image
         output_dir: Directory for output files
+        segmenter: Optional shared segmenter (a new one is created if omitted)
+        save_executor: Optional shared pool for overlay saves
     """
-    segmenter = ProductSegmenter()
+    if segmenter is None:
+        segmenter = ProductSegmenter()
     
     image = segmenter.load_and_preprocess_image(image_path)
     items = segmenter.detect_products(image)
-    segmenter.create_overlay(image, items, output_dir)
+    segmenter.create_overlay(image, items, output_dir, save_executor)
 
 
 def main():
     """Main execution function."""
     test_images = ["assets/soap.jpg", "assets/multiple_products.png", "assets/water_bottle1.jpg"]
     
+    image_paths = []
     for image_path in test_images:
         if os.path.exists(image_path):
-            print(f"\n{'=' * 60}")
-            print(f"Processing: {image_path}")
-            print('=' * 60)
-            extract_segmentation_masks(image_path)
+            image_paths.append(image_path)
         else:
             print(f"Warning: {image_path} not found, skipping")
+    
+    if not image_paths:
+        return
+    
+    # Each image is one blocking Gemini round-trip; run them concurrently
+    # so total latency is the slowest call rather than the sum. Overlays
+    # share one save pool, and each image writes to its own subdirectory
+    # so same-label overlays from different images don't collide.
+    segmenter = ProductSegmenter()
+    
+    def process(image_path: str) -> None:
+        print(f"\n{'=' * 60}")
+        print(f"Processing: {image_path}")
+        print('=' * 60)
+        image_stem = os.path.splitext(os.path.basename(image_path))[0]
+        extract_segmentation_masks(
+            image_path,
+            output_dir=os.path.join("segmentation_outputs", image_stem),
+            segmenter=segmenter,
+            save_executor=save_executor
+        )
+    
+    with ThreadPoolExecutor(max_workers=8) as save_executor, \
+            ThreadPoolExecutor(max_workers=len(image_paths)) as executor:
+        list(executor.map(process, image_paths))
 
 
 if __name__ == "__main__":
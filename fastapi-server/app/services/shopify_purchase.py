@@ -9,6 +9,7 @@ from selenium.webdriver.support.ui import Select
 from selenium.common.exceptions import NoSuchElementException
 from urllib.parse import urlparse
 import requests
+from requests.adapters import HTTPAdapter
 import time
 from typing import Optional, List, Dict, Any
 from pydantic import BaseModel
@@ -67,6 +68,11 @@ class ShopifyPurchaseService:
         # Load default config from environment
         self.default_config = self._load_default_config()
 
+        # Shared keep-alive session so repeat lookups against a store reuse
+        # the TCP/TLS connection instead of handshaking on every request.
+        self._session = requests.Session()
+        self._session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
     def _load_default_config(self) -> Dict[str, str]:
         """Load default purchase configuration from environment variables."""
         return {
@@ -102,9 +108,9 @@ class ShopifyPurchaseService:
             product_url, _, _ = product_url.partition('?')
 
         # Get product XML
-        s = requests.Session()
-        r = s.get(product_url + '.xml')
-        soup = BeautifulSoup(r.text, 'lxml')
+        r = self._session.get(product_url + '.xml')
+        # Hand lxml the raw bytes; it detects the encoding itself in C.
+        soup = BeautifulSoup(r.content, 'lxml')
 
         # Extract product name
         name_tag = soup.find('title')
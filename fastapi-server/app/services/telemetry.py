@@ -5,10 +5,11 @@ from __future__ import annotations
 import time
 from collections import Counter, deque
 from dataclasses import dataclass
+from itertools import islice
 from typing import Deque, Dict, Iterable, Tuple
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class TelemetryEvent:
     timestamp_ms: int
     event_type: str
@@ -20,30 +21,49 @@ class TelemetryClient:
 
     def __init__(self, max_events: int = 200) -> None:
         self._events: Deque[TelemetryEvent] = deque(maxlen=max_events)
+        # Running counts over the retained window, kept in step with the deque
+        # so summary() doesn't rescan every event per poll.
+        self._event_counts: Counter[str] = Counter()
+        self._detection_counts: Counter[str] = Counter()
 
     def emit(self, event_type: str, **payload: str) -> None:
+        if self._events.maxlen == 0:
+            # A zero-size window retains nothing, so there is nothing to count.
+            return
         event = TelemetryEvent(
             timestamp_ms=self._now_ms(),
             event_type=event_type,
             payload={k: str(v) for k, v in payload.items()},
         )
+        if len(self._events) == self._events.maxlen:
+            self._count(self._events[0], -1)
         self._events.append(event)
+        self._count(event, 1)
 
     def recent(self) -> Iterable[TelemetryEvent]:
-        return list(self._events)[-20:]
+        count = len(self._events)
+        return list(islice(self._events, max(0, count - 20), count))
 
     def summary(self) -> Dict[str, Dict[str, int]]:
-        counts = Counter(event.event_type for event in self._events)
-        by_object = Counter(
-            (event.payload.get("object_class") or "unknown")
-            for event in self._events
-            if event.event_type == "detection"
-        )
         return {
-            "events": dict(counts),
-            "detections_by_object": dict(by_object),
+            "events": dict(self._event_counts),
+            "detections_by_object": dict(self._detection_counts),
         }
 
+    def _count(self, event: TelemetryEvent, delta: int) -> None:
+        self._bump(self._event_counts, event.event_type, delta)
+        if event.event_type == "detection":
+            key = event.payload.get("object_class") or "unknown"
+            self._bump(self._detection_counts, key, delta)
+
+    @staticmethod
+    def _bump(counter: Counter[str], key: str, delta: int) -> None:
+        value = counter[key] + delta
+        if value:
+            counter[key] = value
+        else:
+            del counter[key]
+
     @staticmethod
     def _now_ms() -> int:
-        return int(time.time() * 1000)
+        return time.time_ns() // 1_000_000